@@ -4,12 +4,22 @@ import json
 import time
 import re
 import os
+import hashlib
+import bisect
+import numpy as np
 import html as html_lib
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import unicodedata
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas as pdf_canvas
 
-_RANKINGS_CACHE = {}
+_RANKING_HISTORY = None
+_RANKING_DATES_FETCHED = set()
+_PROVISIONAL_RANKINGS = {}
 
 
 def _current_monday_str():
@@ -173,6 +183,29 @@ HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/
 LATAM_CODES = ["ARG", "BOL", "BRA", "CHI", "COL", "CRC", "CUB", "DOM", "ECU", "ESA", "GUA", "HON", "MEX", "NCA", "PAN", "PAR", "PER", "PUR", "URU", "VEN"]
 STATE_FILE = "player_state.json"
 LOG_FILE = "change_log.json"
+RANKINGS_DIR = "rankings_history"
+RANKING_DELTA_DTYPE = np.dtype([("player", "<i4"), ("rank", "<i4"), ("country", "<i2")])
+# A full snapshot every N weeks bounds how many delta rows a lookup has to replay
+RANKING_KEYFRAME_WEEKS = 8
+# A Monday's rankings are only stored once this many days have passed, until then they are re-fetched every run
+RANKING_SETTLE_DAYS = 3
+SUBSCRIBERS_FILE = "subscribers.json"
+NOTIFICATION_QUEUE_FILE = "notification_queue.json"
+DIGEST_DIR = "digests"
+# Used when subscribers.json is missing: one unfiltered daily digest written to DIGEST_DIR.
+# Subscriber keys: name, sink ("file" -> dir, "webhook" -> url), levels, latam_only, every_hours.
+DEFAULT_SUBSCRIBERS = [{"name": "all", "sink": "file", "every_hours": 24}]
+PDF_DIR = "pdf"
+PDF_STATE_FILE = "pdf_state.json"
+# Same page format the old in-browser html2pdf export used (418 x 244 mm landscape).
+PDF_PAGE_SIZE = (418 * mm, 244 * mm)
+# Bump when the PDF layout, fonts or theme images change so every tournament is re-rendered
+PDF_RENDER_VERSION = 1
+PDF_VIEWS = {
+    "MAIN_DRAW": "MAIN DRAW ENTRY LIST",
+    "QUALIFYING": "QUALIFYING ENTRY LIST",
+    "CHANGES": "LIST OF CHANGES",
+}
 
 # WTA country codes mostly follow the IOC's three-letter codes, while the
 # rectangular flag set shared with tenisfemarg uses ISO 3166-1 alpha-2 codes.
@@ -292,43 +325,211 @@ def get_display_content(df, tid, draw_type, availability_date):
             else: final_html.append('<tr>' + content)
         return "".join(final_html)
 
+    return "".join(f'<div class="table-column">{apply_highlights(col)}</div>' for col in split_table_columns(df))
+
+def split_table_columns(df):
+    """Split an entry list into the 1-3 side-by-side columns used by the site and the PDFs."""
     total_players = len(df)
-    
+
     if total_players > 50:
         size = (total_players + 2) // 3
-        col1 = df.iloc[:size]
-        col2 = df.iloc[size:size*2]
-        col3 = df.iloc[size*2:]
-        return (f'<div class="table-column">{apply_highlights(col1)}</div>'
-                f'<div class="table-column">{apply_highlights(col2)}</div>'
-                f'<div class="table-column">{apply_highlights(col3)}</div>')
-    
+        return [df.iloc[:size], df.iloc[size:size*2], df.iloc[size*2:]]
+
     elif total_players > 25:
         midpoint = (total_players + 1) // 2
-        return (f'<div class="table-column">{apply_highlights(df.iloc[:midpoint])}</div>'
-                f'<div class="table-column">{apply_highlights(df.iloc[midpoint:])}</div>')
-    
-    return f'<div class="table-column">{apply_highlights(df)}</div>'
+        return [df.iloc[:midpoint], df.iloc[midpoint:]]
+
+    return [df]
+
+def _register_pdf_fonts():
+    registered = pdfmetrics.getRegisteredFontNames()
+    for font_name, font_file in [("MontserratExtraBold", "Montserrat-ExtraBold.ttf"), ("MontserratSemiBold", "Montserrat-SemiBold.ttf")]:
+        if font_name not in registered:
+            pdfmetrics.registerFont(TTFont(font_name, font_file))
+
+def _draw_pdf_page_chrome(c, full_name, sub_title):
+    """Paint the gradient background, title stack and logo. Returns the y where content starts."""
+    page_w, page_h = PDF_PAGE_SIZE
+
+    # Emulate `background-size: cover` for FondoDegradado.png
+    background = ImageReader("FondoDegradado.png")
+    img_w, img_h = background.getSize()
+    scale = max(page_w / img_w, page_h / img_h)
+    draw_w, draw_h = img_w * scale, img_h * scale
+    c.drawImage(background, (page_w - draw_w) / 2, (page_h - draw_h) / 2, draw_w, draw_h)
+
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("MontserratExtraBold", 15)
+    c.drawCentredString(page_w / 2, page_h - 40, sub_title)
+    c.setFont("MontserratExtraBold", 20)
+    c.drawCentredString(page_w / 2, page_h - 66, full_name)
+
+    logo = ImageReader("LOGO.png")
+    logo_w, logo_h = logo.getSize()
+    logo_draw_h = 25
+    logo_draw_w = logo_w * logo_draw_h / logo_h
+    c.drawImage(logo, (page_w - logo_draw_w) / 2, 18, logo_draw_w, logo_draw_h, mask='auto')
+
+    return page_h - 90
+
+def _draw_pdf_table(c, x, y_top, width, headers, weights, rows, row_h, bold_rows=(), left_cols=()):
+    """Draw a `.entry-table` lookalike. `rows` may contain (bold, regular) tuples for rich cells."""
+    height = row_h * (len(rows) + 1)
+    font_size = min(9, row_h * 0.6)
+    col_widths = [width * w / sum(weights) for w in weights]
+
+    c.saveState()
+    c.setFillColorRGB(0, 0, 0)
+    c.setFillAlpha(0.2)
+    c.setStrokeColorRGB(1, 1, 1)
+    c.setStrokeAlpha(0.35)
+    c.roundRect(x, y_top - height, width, height, 4, stroke=1, fill=1)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFillAlpha(0.1)
+    c.rect(x, y_top - row_h, width, row_h, stroke=0, fill=1)
+    c.setStrokeAlpha(0.12)
+    for i in range(1, len(rows) + 1):
+        c.line(x, y_top - row_h * i, x + width, y_top - row_h * i)
+    c.restoreState()
+
+    c.setFillColorRGB(1, 1, 1)
+    baseline = (row_h - font_size) / 2 + font_size * 0.15
+    for r, cells in enumerate([headers] + list(rows)):
+        y = y_top - row_h * (r + 1) + baseline
+        font = "MontserratExtraBold" if r == 0 or (r - 1) in bold_rows else "MontserratSemiBold"
+        cx = x
+        for i, cell in enumerate(cells):
+            if isinstance(cell, tuple):
+                bold_text, text = cell
+                c.setFont("MontserratExtraBold", font_size)
+                c.drawString(cx + 12, y, bold_text)
+                c.setFont(font, font_size)
+                c.drawString(cx + 12 + pdfmetrics.stringWidth(bold_text, "MontserratExtraBold", font_size), y, text)
+            elif i in left_cols:
+                c.setFont(font, font_size)
+                c.drawString(cx + 12, y, str(cell))
+            else:
+                c.setFont(font, font_size)
+                c.drawCentredString(cx + col_widths[i] / 2, y, str(cell))
+            cx += col_widths[i]
+
+def _draw_pdf_message(c, y_top, message):
+    c.setFillColorRGB(1, 1, 1)
+    c.setFillAlpha(0.6)
+    c.setFont("MontserratSemiBold", 12)
+    c.drawCentredString(PDF_PAGE_SIZE[0] / 2, y_top - 40, message)
+    c.setFillAlpha(1)
+
+def render_entry_list_pdf(path, full_name, sub_title, df, availability_date):
+    c = pdf_canvas.Canvas(path, pagesize=PDF_PAGE_SIZE, invariant=True)
+    c.setTitle(f"{full_name} - {sub_title.title()}")
+    y_top = _draw_pdf_page_chrome(c, full_name, sub_title)
 
-def track_changes(tid, draw_type, current_names, t_name, skip_notifications=False):
+    if df.empty:
+        _draw_pdf_message(c, y_top, f"This list will most likely be available on the WTA website on {format_pretty_date(availability_date)}")
+    else:
+        page_w = PDF_PAGE_SIZE[0]
+        columns = split_table_columns(df)
+        gap = 20
+        col_w = min(330, (page_w - 60 - gap * (len(columns) - 1)) / len(columns))
+        x = (page_w - (col_w * len(columns) + gap * (len(columns) - 1))) / 2
+        max_rows = max(len(col) for col in columns)
+        row_h = min(20, (y_top - 55) / (max_rows + 1))
+        headers = list(df.columns)
+        for col in columns:
+            bold_rows = {i for i, country in enumerate(col['Country']) if str(country).upper() in LATAM_CODES}
+            _draw_pdf_table(c, x, y_top, col_w, headers, [1, 4, 1.4, 1.2], col.values.tolist(), row_h, bold_rows=bold_rows)
+            x += col_w + gap
+
+    c.showPage()
+    c.save()
+
+def render_changes_pdf(path, full_name, history):
+    c = pdf_canvas.Canvas(path, pagesize=PDF_PAGE_SIZE, invariant=True)
+    c.setTitle(f"{full_name} - List Of Changes")
+    page_w = PDF_PAGE_SIZE[0]
+    col_w = 430
+    row_h = 17
+
+    rows = []
+    for entry in history:
+        m = re.match(r'<strong>(.*?)</strong>(.*)', entry["change"])
+        change = (html_lib.unescape(m.group(1)), html_lib.unescape(m.group(2))) if m else html_lib.unescape(re.sub(r'<.*?>', '', entry["change"]))
+        rows.append([entry["date"], change])
+
+    y_top = _draw_pdf_page_chrome(c, full_name, PDF_VIEWS["CHANGES"])
+    if not rows:
+        _draw_pdf_message(c, y_top, "No changes recorded yet.")
+        c.showPage()
+
+    per_page = int((y_top - 55) // row_h) - 1
+    for start in range(0, len(rows), per_page):
+        if start:
+            y_top = _draw_pdf_page_chrome(c, full_name, PDF_VIEWS["CHANGES"])
+        _draw_pdf_table(c, (page_w - col_w) / 2, y_top, col_w, ["DATE", "CHANGE"], [1, 3], rows[start:start + per_page], row_h, left_cols={1})
+        c.showPage()
+
+    c.save()
+
+def export_tournament_pdfs(tid, data, pdf_state):
+    """Render the main draw, qualifying and changes PDFs, skipping tournaments whose content hash is unchanged."""
+    paths = {view: f"{PDF_DIR}/{tid}_{view}.pdf" for view in PDF_VIEWS}
+    content_hash = hashlib.sha256(f'{PDF_RENDER_VERSION}\n{data["full_name"]}\n{data["content"]}'.encode("utf-8")).hexdigest()
+    if pdf_state.get(tid) == content_hash and all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    _register_pdf_fonts()
+    os.makedirs(PDF_DIR, exist_ok=True)
+    render_entry_list_pdf(paths["MAIN_DRAW"], data["full_name"], PDF_VIEWS["MAIN_DRAW"], data["main_df"], data["main_available"])
+    render_entry_list_pdf(paths["QUALIFYING"], data["full_name"], PDF_VIEWS["QUALIFYING"], data["qual_df"], data["qual_available"])
+    render_changes_pdf(paths["CHANGES"], data["full_name"], data["history"])
+    pdf_state[tid] = content_hash
+    return paths
+
+def prune_stale_pdfs(pdf_state, active_tids):
+    for tid in [t for t in pdf_state if t not in active_tids]:
+        for view in PDF_VIEWS:
+            path = f"{PDF_DIR}/{tid}_{view}.pdf"
+            if os.path.exists(path): os.remove(path)
+        del pdf_state[tid]
+
+def track_changes(tid, draw_type, current_names, t_name, skip_notifications=False, level=None, countries=None, label=None):
+    """Record list changes in the web log and return them as notification events."""
     state = load_json(STATE_FILE)
     history = load_json(LOG_FILE)
     key = f"{tid.upper()}_{draw_type.replace(' ', '_').upper()}"
     prev_names = set(state.get(key, []))
+    prev_countries = state.get(f"{key}_COUNTRIES", {})
     curr_names_set = set(current_names)
     today = datetime.now().strftime("%Y-%m-%d")
     new_entries_for_web = []
+    events = []
+
+    def event(action, name=None, country=None):
+        return {"date": today, "tid": tid, "tournament": label or t_name, "full_name": t_name, "level": level,
+                "draw": draw_type, "action": action, "player": name.upper() if name else None, "country": country}
 
-    if not skip_notifications:
+    # An empty scrape of a list we already have is treated as a failed scrape: the saved state is
+    # kept below, so reporting its players as removed would repeat on every empty run and never
+    # be cancelled by a matching "added" once the list comes back.
+    if not skip_notifications and (current_names or not prev_names):
         if prev_names:
-            for name in prev_names:
-                if name not in curr_names_set:
-                    msg = f"<strong>{name.upper()}</strong> removed from {draw_type}"
-                    new_entries_for_web.append({"date": today, "change": msg})
+            removed = [name for name in prev_names if name not in curr_names_set]
+            # Removed players are no longer in the processed list, so use the country saved with the
+            # previous list (state written before countries were saved falls back to the rankings)
+            _, ranked_countries = rankings_at(_current_monday_str(), [(None, name) for name in removed])
+            for name, ranked_country in zip(removed, ranked_countries):
+                country = prev_countries.get(name) or ranked_country
+                msg = f"<strong>{name.upper()}</strong> removed from {draw_type}"
+                new_entries_for_web.append({"date": today, "change": msg})
+                events.append(event("removed", name, country))
             for name in curr_names_set:
                 if name not in prev_names:
                     msg = f"<strong>{name.upper()}</strong> added to {draw_type}"
                     new_entries_for_web.append({"date": today, "change": msg})
+                    events.append(event("added", name, (countries or {}).get(name)))
+        elif current_names:
+            events.append(event("available"))
 
     if new_entries_for_web:
         if tid not in history: history[tid] = []
@@ -337,38 +538,136 @@ def track_changes(tid, draw_type, current_names, t_name, skip_notifications=Fals
     
     if current_names or not prev_names:
         state[key] = list(current_names)
+        state[f"{key}_COUNTRIES"] = {name: (countries or {}).get(name) for name in current_names}
         save_json(STATE_FILE, state)
 
-    return []
+    return events
+
+def _notification_key(event):
+    return (event["tid"], event["draw"], event["player"])
+
+def _subscriber_wants(subscriber, event):
+    if subscriber.get("levels") and event.get("level") not in subscriber["levels"]:
+        return False
+    # List-available events have no player, so they pass the LATAM filter
+    if subscriber.get("latam_only") and event["player"] and str(event.get("country") or "").upper() not in LATAM_CODES:
+        return False
+    return True
+
+def enqueue_notifications(pending, events):
+    """Coalesce new events into a subscriber's pending list.
+
+    An add and a remove of the same player in the same draw cancel out, so a digest only
+    reports the net change since it was last sent. Cost is O(pending + events).
+    """
+    opposite = {"added": "removed", "removed": "added"}
+    by_key = {_notification_key(e): e for e in pending if e["player"]}
+    dropped = set()
+    for e in events:
+        key = _notification_key(e)
+        prev = by_key.get(key) if e["player"] else None
+        if prev is not None and prev["action"] == opposite.get(e["action"]):
+            dropped.add(id(prev))
+            del by_key[key]
+        elif prev is None:
+            pending.append(e)
+            if e["player"]: by_key[key] = e
+    return [e for e in pending if id(e) not in dropped]
+
+def format_notification_digest(events):
+    """Plain-text digest in the email_body.txt format, grouped by the sidebar label.
+
+    Each line starts with "<level>  - <full name> <draw>" like the existing email body.
+    """
+    tournaments = {}
+    for e in events:
+        tournaments.setdefault(e["tournament"], []).append(e)
+
+    lines = ["The following changes were detected:"]
+    for label, tourney_events in tournaments.items():
+        lines += ["", f"Tournament: {label}"]
+        for e in tourney_events:
+            prefix = f'{e["level"] or ""}  - {e.get("full_name") or label} {e["draw"]}'
+            if e["action"] == "available":
+                lines.append(f'- {prefix} list is now available.')
+            else:
+                country = f' ({e["country"]})' if e.get("country") else ""
+                lines.append(f'- {prefix}: {e["player"]}{country} {e["action"]}.')
+    return "\n".join(lines)
+
+def _file_sink(subscriber, digest, events):
+    # One file per digest; undelivered changes stay in the queue until this write succeeds
+    digest_dir = subscriber.get("dir") or DIGEST_DIR
+    os.makedirs(digest_dir, exist_ok=True)
+    path = os.path.join(digest_dir, f'{subscriber["name"]}_{datetime.now().strftime("%Y%m%d-%H%M%S")}.txt')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(digest)
+
+def _webhook_sink(subscriber, digest, events):
+    r = requests.post(subscriber["url"], json={"text": digest, "changes": events}, timeout=10)
+    r.raise_for_status()
+
+# Delivery targets by subscriber "sink" name; add an entry here to plug in another channel.
+NOTIFICATION_SINKS = {
+    "file": _file_sink,
+    "webhook": _webhook_sink,
+}
+
+def dispatch_notifications(events):
+    """Queue this run's change events per subscriber and deliver digests that are due.
+
+    Only the events produced in this run and each subscriber's undelivered queue are
+    touched; change_log.json is never re-read.
+    """
+    subscribers = load_json(SUBSCRIBERS_FILE) or DEFAULT_SUBSCRIBERS
+    queue = load_json(NOTIFICATION_QUEUE_FILE)
+    now = datetime.now()
+
+    for subscriber in subscribers:
+        entry = queue.setdefault(subscriber["name"], {"pending": [], "last_sent": None})
+        entry["pending"] = enqueue_notifications(entry["pending"], [e for e in events if _subscriber_wants(subscriber, e)])
+        if not entry["pending"]:
+            continue
+
+        last_sent = datetime.fromisoformat(entry["last_sent"]) if entry["last_sent"] else None
+        if last_sent and now - last_sent < timedelta(hours=subscriber.get("every_hours", 0)):
+            continue
+
+        sink = NOTIFICATION_SINKS.get(subscriber.get("sink", "file"))
+        if sink is None:
+            print(f"Unknown notification sink for {subscriber['name']}: {subscriber.get('sink')}")
+            continue
+        try:
+            sink(subscriber, format_notification_digest(entry["pending"]), entry["pending"])
+        except Exception as e:
+            # Keep the queue so the digest is retried on the next run
+            print(f"Error delivering notifications to {subscriber['name']}: {e}")
+            continue
+        entry["pending"], entry["last_sent"] = [], now.isoformat(timespec="seconds")
 
-def process_players(players, rankings_df):
+    save_json(NOTIFICATION_QUEUE_FILE, queue)
+
+def process_players(players, ranking_date):
     if not players: return pd.DataFrame(columns=['Pos.', 'Player', 'Country', 'Rank'])
 
     # Normalize: accept list of strings (cache) or list of dicts (API)
     if isinstance(players[0], str):
         players = [{"name": p, "country": None} for p in players]
 
-    processed_data = []
-    rankings_dict = {}
-    if not rankings_df.empty:
-        rankings_dict = rankings_df.drop_duplicates(subset=['player']).set_index(rankings_df['player'].drop_duplicates().str.upper()).to_dict('index')
+    # One vectorized lookup for the whole list, by WTA id where known and by name otherwise
+    ranks, countries = rankings_at(ranking_date, [(p.get("id"), p["name"]) for p in players])
 
-    for player in players:
+    processed_data = []
+    for player, rank_val, ranked_country in zip(players, ranks, countries):
         clean_name = player["name"].strip().title()
         upper_name = clean_name.upper()
 
-        rank_info = rankings_dict.get(upper_name, {})
-        country = rank_info.get('country') or player.get("country") or '-'
-        rank = str(rank_info.get('ranking', '-'))
+        country = ranked_country or player.get("country") or '-'
+        rank = str(rank_val) if rank_val > 0 else '-'
 
         if upper_name in PLAYER_OVERRIDES:
             country = PLAYER_OVERRIDES[upper_name].get('country', country)
 
-        if rank.lower() in ['nan', 'none', '']:
-            rank = '-'
-        else:
-            rank = rank.replace('.0', '')
-
         processed_data.append({
             'Player': clean_name,
             'Country': country,
@@ -383,26 +682,215 @@ def process_players(players, rankings_df):
     return df[['Pos.', 'Player', 'Country', 'Rank']]
 
 def get_rankings_from_api(date_str):
-    all_players, page = [], 0
+    """Fetch every ranking page for `date_str`. Returns (DataFrame, complete); `complete` is False if a page failed."""
+    all_players, page, complete = [], 0, True
     while True:
         params = {"metric": "SINGLES", "type": "rankSingles", "sort": "asc", "at": date_str, "pageSize": 100, "page": page}
         try:
             r = requests.get(API_URL, params=params, headers=HEADERS, timeout=10)
+            # An error response (rate limit, 5xx) must not look like an empty last page
+            r.raise_for_status()
             data = r.json()
             items = data.get('content', []) if isinstance(data, dict) else data
             if not items: break
             all_players.extend(items)
             page += 1
             time.sleep(0.05)
-        except: break
-    return pd.DataFrame([{'ranking': p.get('ranking'), 'player': (p.get('player') or {}).get('fullName'), 'country': (p.get('player') or {}).get('countryCode')} for p in all_players if p])
-
-
-def get_rankings_cached(date_str):
-    """Cached wrapper around `get_rankings_from_api` (reduces duplicate API calls)."""
-    if date_str not in _RANKINGS_CACHE:
-        _RANKINGS_CACHE[date_str] = get_rankings_from_api(date_str)
-    return _RANKINGS_CACHE[date_str]
+        except Exception as e:
+            print(f"Error fetching rankings for {date_str} (page {page}): {e}")
+            complete = False
+            break
+    return pd.DataFrame([{'ranking': p.get('ranking'), 'id': (p.get('player') or {}).get('id'), 'player': (p.get('player') or {}).get('fullName'), 'country': (p.get('player') or {}).get('countryCode')} for p in all_players if p]), complete
+
+
+# Ranking history store
+# ---------------------
+# Weekly singles rankings are kept as a columnar, delta-encoded history under
+# RANKINGS_DIR instead of one full DataFrame per Monday:
+#   index.json  - week dates, row offsets into deltas.npy, keyframe flags and the
+#                 player (id, name) / country dictionaries the integer columns point into
+#   deltas.npy  - (player, rank, country) int rows; a keyframe week stores every ranked
+#                 player, other weeks only the rows that changed since the previous week
+#                 (rank 0 means the player dropped out of the rankings)
+# deltas.npy is opened memory-mapped, so a lookup only touches the rows between the
+# nearest keyframe and the requested week.
+
+def _empty_ranking_deltas():
+    return np.zeros(0, dtype=RANKING_DELTA_DTYPE)
+
+def _ranking_player_key(pid, name):
+    return str(int(pid)) if pd.notna(pid) and str(pid).strip() else str(name).strip().upper()
+
+def _pad_ranking_week(week, n_players):
+    ranks, countries = week
+    pad = n_players - len(ranks)
+    return np.concatenate([ranks, np.zeros(pad, dtype=np.int32)]), np.concatenate([countries, np.full(pad, -1, dtype=np.int16)])
+
+def load_ranking_history():
+    global _RANKING_HISTORY
+    if _RANKING_HISTORY is None:
+        index = load_json(os.path.join(RANKINGS_DIR, "index.json")) or {"weeks": [], "offsets": [0], "keyframes": [], "players": [], "countries": []}
+        deltas_path = os.path.join(RANKINGS_DIR, "deltas.npy")
+        deltas = np.load(deltas_path, mmap_mode="r") if os.path.exists(deltas_path) else _empty_ranking_deltas()
+        _RANKING_HISTORY = {
+            "index": index,
+            "deltas": deltas,
+            "id_to_idx": {str(pid): i for i, (pid, _) in enumerate(index["players"])},
+            "name_to_idx": {name.upper(): i for i, (_, name) in enumerate(index["players"])},
+            "country_to_idx": {c: i for i, c in enumerate(index["countries"])},
+        }
+    return _RANKING_HISTORY
+
+def _save_ranking_history(history):
+    os.makedirs(RANKINGS_DIR, exist_ok=True)
+    deltas_path = os.path.join(RANKINGS_DIR, "deltas.npy")
+    tmp_path = deltas_path + ".tmp.npy"
+    np.save(tmp_path, np.asarray(history["deltas"]))
+    history["deltas"] = _empty_ranking_deltas()  # release the old mapping before swapping the file
+    os.replace(tmp_path, deltas_path)
+    save_json(os.path.join(RANKINGS_DIR, "index.json"), history["index"])
+    history["deltas"] = np.load(deltas_path, mmap_mode="r")
+
+def _decode_ranking_week(history, week_pos):
+    """Dense (ranks, countries) arrays over all known players for the week at `week_pos`."""
+    index = history["index"]
+    n_players = len(index["players"])
+    ranks = np.zeros(n_players, dtype=np.int32)
+    countries = np.full(n_players, -1, dtype=np.int16)
+    if week_pos < 0:
+        return ranks, countries
+
+    keyframe_pos = max(i for i in range(week_pos + 1) if index["keyframes"][i])
+    rows = history["deltas"][index["offsets"][keyframe_pos]:index["offsets"][week_pos + 1]]
+    # Later rows win: take the first occurrence of each player in the reversed slice
+    rows = rows[::-1]
+    players, first = np.unique(rows["player"], return_index=True)
+    ranks[players] = rows["rank"][first]
+    countries[players] = rows["country"][first]
+    return ranks, countries
+
+def _encode_ranking_week(prev, curr, keyframe):
+    # Snapshots decoded before new players were added are shorter; those players are unranked there
+    n_players = max(len(prev[0]), len(curr[0]))
+    prev_ranks, prev_countries = _pad_ranking_week(prev, n_players)
+    ranks, countries = _pad_ranking_week(curr, n_players)
+
+    if keyframe:
+        players = np.flatnonzero(ranks > 0)
+    else:
+        players = np.flatnonzero((ranks != prev_ranks) | (countries != prev_countries))
+    rows = np.zeros(len(players), dtype=RANKING_DELTA_DTYPE)
+    rows["player"], rows["rank"], rows["country"] = players, ranks[players], countries[players]
+    return rows
+
+def store_ranking_week(date_str, rankings_df):
+    """Add one week of rankings to the history, re-encoding any later weeks against it."""
+    history = load_ranking_history()
+    index = history["index"]
+    weeks = index["weeks"]
+    pos = bisect.bisect_left(weeks, date_str)
+    if pos < len(weeks) and weeks[pos] == date_str:
+        return
+
+    # Decode the previous week and every later one before the player dictionary grows
+    prev_and_later = [_decode_ranking_week(history, i) for i in range(pos - 1, len(weeks))]
+
+    rankings_df = rankings_df.dropna(subset=['player', 'ranking'])
+    for row in rankings_df.itertuples(index=False):
+        key = _ranking_player_key(row.id, row.player)
+        if key not in history["id_to_idx"]:
+            history["id_to_idx"][key] = len(index["players"])
+            history["name_to_idx"].setdefault(row.player.upper(), len(index["players"]))
+            index["players"].append([key, row.player])
+        if pd.notna(row.country) and row.country not in history["country_to_idx"]:
+            history["country_to_idx"][row.country] = len(index["countries"])
+            index["countries"].append(row.country)
+
+    n_players = len(index["players"])
+    ranks = np.zeros(n_players, dtype=np.int32)
+    countries = np.full(n_players, -1, dtype=np.int16)
+    for row in rankings_df.itertuples(index=False):
+        idx = history["id_to_idx"][_ranking_player_key(row.id, row.player)]
+        ranks[idx] = int(row.ranking)
+        countries[idx] = history["country_to_idx"].get(row.country, -1)
+
+    snapshots = [prev_and_later[0], (ranks, countries)] + prev_and_later[1:]
+    new_weeks = weeks[:pos] + [date_str] + weeks[pos:]
+    keyframes = [i % RANKING_KEYFRAME_WEEKS == 0 for i in range(len(new_weeks))]
+    chunks, offsets = [np.asarray(history["deltas"][:index["offsets"][pos]])], index["offsets"][:pos + 1]
+    for i in range(pos, len(new_weeks)):
+        rows = _encode_ranking_week(snapshots[i - pos], snapshots[i - pos + 1], keyframes[i])
+        chunks.append(rows)
+        offsets.append(offsets[-1] + len(rows))
+
+    index["weeks"], index["offsets"], index["keyframes"] = new_weeks, offsets, keyframes
+    history["deltas"] = np.concatenate(chunks)
+    _save_ranking_history(history)
+
+def ensure_ranking_week(date_str):
+    """Fetch the rankings published on `date_str` unless the history already has them.
+
+    Only complete fetches of settled weeks (RANKING_SETTLE_DAYS past their Monday) are stored.
+    Anything else is kept for this run only and fetched again on the next one, so a timeout or
+    a list WTA hasn't published yet never becomes permanent.
+    """
+    if date_str in _RANKING_DATES_FETCHED or date_str in load_ranking_history()["index"]["weeks"]:
+        return
+    _RANKING_DATES_FETCHED.add(date_str)
+    rankings_df, complete = get_rankings_from_api(date_str)
+    if rankings_df.empty:
+        return
+    settled = datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=RANKING_SETTLE_DAYS) <= datetime.now()
+    if complete and settled:
+        store_ranking_week(date_str, rankings_df)
+    else:
+        _PROVISIONAL_RANKINGS[date_str] = rankings_df.dropna(subset=['player', 'ranking'])
+
+def _provisional_rankings_at(date_str):
+    """This run's unstored rankings for `date_str`, if they are newer than the stored week it would use."""
+    weeks = load_ranking_history()["index"]["weeks"]
+    pos = bisect.bisect_right(weeks, date_str) - 1
+    stored = weeks[pos] if pos >= 0 else ""
+    candidates = [d for d in _PROVISIONAL_RANKINGS if stored < d <= date_str]
+    return _PROVISIONAL_RANKINGS[max(candidates)] if candidates else None
+
+def rankings_at(date_str, players):
+    """Ranks and countries at `date_str` for `players`, a list of (wta_id, name) pairs.
+
+    Uses the latest stored (or this run's provisional) week on or before the date; unranked
+    players get rank 0 and country None.
+    """
+    provisional = _provisional_rankings_at(date_str)
+    if provisional is not None:
+        rows = list(zip(provisional['ranking'], provisional['country']))
+        by_key = dict(zip((_ranking_player_key(pid, name) for pid, name in zip(provisional['id'], provisional['player'])), rows))
+        by_name = dict(zip(provisional['player'].str.upper(), rows))
+        found = [by_key.get(_ranking_player_key(pid, name), by_name.get(str(name).strip().upper(), (0, None))) for pid, name in players]
+        ranks = np.array([int(rank) for rank, _ in found], dtype=np.int32)
+        return ranks, [country if pd.notna(country) else None for _, country in found]
+
+    history = load_ranking_history()
+    index = history["index"]
+    idx = np.array([
+        history["id_to_idx"].get(_ranking_player_key(pid, name), history["name_to_idx"].get(str(name).strip().upper(), -1))
+        for pid, name in players
+    ], dtype=np.int64)
+
+    week_ranks, week_countries = _decode_ranking_week(history, bisect.bisect_right(index["weeks"], date_str) - 1)
+    known = idx >= 0
+    ranks = np.where(known, week_ranks[np.where(known, idx, 0)], 0) if len(week_ranks) else np.zeros(len(idx), dtype=np.int32)
+    country_idx = np.where(known, week_countries[np.where(known, idx, 0)], -1) if len(week_countries) else np.full(len(idx), -1)
+    countries = [index["countries"][c] if c >= 0 else None for c in country_idx]
+    return ranks, countries
+
+def ranked_names_at(date_str):
+    """Upper-cased names of every player holding a ranking at `date_str`."""
+    provisional = _provisional_rankings_at(date_str)
+    if provisional is not None:
+        return set(provisional['player'].str.upper())
+    history = load_ranking_history()
+    ranks, _ = _decode_ranking_week(history, bisect.bisect_right(history["index"]["weeks"], date_str) - 1)
+    return {history["index"]["players"][i][1].upper() for i in np.flatnonzero(ranks > 0)}
 
 def fetch_player_info(player_id):
     url = f"https://api.wtatennis.com/tennis/players/{player_id}/matches"
@@ -424,7 +912,7 @@ def fetch_player_info(player_id):
         pass
     return None
 
-def scrape_tournament(url, tab_label, tid):
+def scrape_tournament(url, tab_label, tid, level=None):
     tid = tid.upper().replace(" ", "_").replace(".", "").replace("-", "_").replace("'", "")
     print(f"Scraping {tab_label}...")
     try:
@@ -466,8 +954,8 @@ def scrape_tournament(url, tab_label, tid):
     today_monday = _current_monday_str()
     md_ranking_date = md_date if md_date <= today_monday else today_monday
     qual_ranking_date = qual_date if qual_date <= today_monday else today_monday
-    md_rankings = get_rankings_cached(md_ranking_date)
-    qual_rankings = get_rankings_cached(qual_ranking_date)
+    ensure_ranking_week(md_ranking_date)
+    ensure_ranking_week(qual_ranking_date)
 
     main_entries, qual_entries, section = [], [], "MAIN"
     main_seen, qual_seen = set(), set()
@@ -488,10 +976,7 @@ def scrape_tournament(url, tab_label, tid):
                 qual_entries.append((pid, slug))
 
     # Build set of ranked player names for quick lookup
-    ranked_names = set()
-    for rankings_df in [md_rankings, qual_rankings]:
-        if not rankings_df.empty:
-            ranked_names.update(rankings_df['player'].dropna().str.upper())
+    ranked_names = ranked_names_at(md_ranking_date) | ranked_names_at(qual_ranking_date)
 
     # Resolve: slug-derived name for ranked players, API only for unranked
     player_cache = {}
@@ -502,11 +987,11 @@ def scrape_tournament(url, tab_label, tid):
         seen_pids.add(pid)
         candidate = slug.replace("-", " ").upper()
         if candidate in ranked_names:
-            player_cache[pid] = {"name": candidate, "country": None}
+            player_cache[pid] = {"id": pid, "name": candidate, "country": None}
         else:
             info = fetch_player_info(pid)
             if info:
-                player_cache[pid] = info
+                player_cache[pid] = dict(info, id=pid)
             time.sleep(0.05)
 
     main_players = [player_cache[pid] for pid, _ in main_entries if pid in player_cache]
@@ -520,12 +1005,12 @@ def scrape_tournament(url, tab_label, tid):
             main_players = state[md_key]
             used_cached_main = True
 
-    main_df = process_players(main_players, md_rankings)
-    qual_df = process_players(qual_players, qual_rankings)
+    main_df = process_players(main_players, md_ranking_date)
+    qual_df = process_players(qual_players, qual_ranking_date)
     
     run_notifications = []
-    run_notifications.extend(track_changes(tid, "Main Draw", main_df['Player'].tolist(), full_name, skip_notifications=used_cached_main))
-    run_notifications.extend(track_changes(tid, "Qualifying", qual_df['Player'].tolist(), full_name))
+    run_notifications.extend(track_changes(tid, "Main Draw", main_df['Player'].tolist(), full_name, skip_notifications=used_cached_main, level=level, countries=dict(zip(main_df['Player'], main_df['Country'])), label=tab_label))
+    run_notifications.extend(track_changes(tid, "Qualifying", qual_df['Player'].tolist(), full_name, level=level, countries=dict(zip(qual_df['Player'], qual_df['Country'])), label=tab_label))
 
     main_draw_html = f'<div class="main-draw-view">{get_display_content(main_df, tid, "Main Draw", fri_md)}</div>'
     qual_html = f'<div class="qual-view" style="display:none;">{get_display_content(qual_df, tid, "Qualifying", fri_qual)}</div>'
@@ -538,7 +1023,16 @@ def scrape_tournament(url, tab_label, tid):
         rows = "".join([f'<tr><td>{e["date"]}</td><td style="text-align:left; padding-left:20px;">{e["change"]}</td></tr>' for e in fresh_history])
         changes_body = f'<div class="table-column" style="max-width:550px; margin: 0 auto;"><table class="entry-table"><thead><tr><th>DATE</th><th style="text-align:left; padding-left:20px;">CHANGE</th></tr></thead><tbody>{rows}</tbody></table></div>'
     
-    return {"full_name": full_name, "content": main_draw_html + qual_html + f'<div class="changes-view" style="display:none; justify-content: center;">{changes_body}</div>', "notifications": run_notifications}
+    return {
+        "full_name": full_name,
+        "content": main_draw_html + qual_html + f'<div class="changes-view" style="display:none; justify-content: center;">{changes_body}</div>',
+        "notifications": run_notifications,
+        "main_df": main_df,
+        "qual_df": qual_df,
+        "main_available": fri_md,
+        "qual_available": fri_qual,
+        "history": fresh_history,
+    }
 
 def main():
     old_content = {}
@@ -551,6 +1045,9 @@ def main():
             except: pass
 
     sidebar_html, content_html, is_first = "", "", True
+    pdf_state = load_json(PDF_STATE_FILE)
+    pdf_tids = set()
+    run_notifications = []
 
     for week, tourneys in TOURNAMENT_GROUPS.items():
         sidebar_html += f'<div class="week-title">{week}</div>'
@@ -559,9 +1056,12 @@ def main():
             label = info["name"]
 
             tid = label.replace(" ", "_").replace(".", "").replace("-", "_").replace("'", "").upper()
-            data = scrape_tournament(url, label, tid)
+            data = scrape_tournament(url, label, tid, level=info["level"])
             
             if data:
+                run_notifications.extend(data["notifications"])
+                pdf_paths = export_tournament_pdfs(tid, data, pdf_state)
+                pdf_tids.add(tid)
                 body = f'''
                 <div class="top-row">
                     <div class="header-controls">
@@ -574,7 +1074,7 @@ def main():
                         <h1 class="main-title">{data["full_name"]}</h1>
                     </div>
                     <div class="pdf-container">
-                        <button class="toggle-btn pdf-btn" onclick="exportToPDF('{tid}')">PDF</button>
+                        <a class="toggle-btn pdf-btn" href="{pdf_paths["MAIN_DRAW"]}" data-pdf-base="{PDF_DIR}/{tid}_" target="_blank">PDF</a>
                     </div>
                 </div>
                 {data["content"]}
@@ -582,6 +1082,7 @@ def main():
                 '''
             elif tid in old_content: 
                 body = old_content[tid]
+                pdf_tids.add(tid)
             else: 
                 continue
 
@@ -590,6 +1091,10 @@ def main():
             sidebar_html += f'<button class="tablinks {active_btn}" onclick="openTourney(event, \'{tid}\')">{label}</button>'
             content_html += f'<div id="{tid}" class="tabcontent" style="{active_div}">{body}</div>'
 
+    prune_stale_pdfs(pdf_state, pdf_tids)
+    save_json(PDF_STATE_FILE, pdf_state)
+    dispatch_notifications(run_notifications)
+
     full_site_html = f"""<!DOCTYPE html>
     <html lang="en">
     <head>
@@ -624,12 +1129,7 @@ def main():
             .pdf-container {{ flex: 1; display: flex; justify-content: flex-end; }}
             .tournament-logo {{ height: 25px; }}
             .spacer {{ flex: 1; }}
-            .pdf-btn {{ width: 60px !important; }}
-            .is-exporting .header-controls, 
-            .is-exporting .pdf-btn,
-            .is-exporting .spacer {{ display: none !important; }}
-            .is-exporting .top-row {{ justify-content: center !important; display: flex !important; width: 100% !important; }}
-            .is-exporting .title-stack {{ flex: 0 0 100% !important; max-width: 100% !important; margin: 0 auto !important; padding: 0 !important; }}
+            .pdf-btn {{ width: 60px !important; display: inline-flex; align-items: center; justify-content: center; text-decoration: none; }}
             @media print {{ .main-content {{ background: black !important; color: white !important; }} }}
             @media (max-width: 768px) {{
                 body {{ flex-direction: column; }}
@@ -644,7 +1144,6 @@ def main():
                 .title-stack {{ order: 2 !important; flex: 0 0 100% !important; width: 100%; text-align: center; margin-top: 10px;}}
             }}
         </style>
-        <script src="https://cdnjs.cloudflare.com/ajax/libs/html2pdf.js/0.10.1/html2pdf.bundle.min.js"></script>
     </head>
     <body>
         <div class="sidebar">{sidebar_html}</div>
@@ -674,6 +1173,7 @@ def main():
                 qualView.style.display = isMain ? "flex" : "none";
                 btn.innerText = isMain ? "Main Draw" : "Qualifying";
                 subTitle.innerText = isMain ? "QUALIFYING ENTRY LIST" : "MAIN DRAW ENTRY LIST";
+                setPdfView(activeTab, isMain ? "QUALIFYING" : "MAIN_DRAW");
             }}
             function showChanges(btn, tid) {{
                 const activeTab = document.getElementById(tid);
@@ -684,6 +1184,7 @@ def main():
                 btn.style.display = "none";
                 activeTab.querySelector('.main-qual-toggle').innerText = "Main Draw";
                 activeTab.querySelector('.back-to-qual-btn').style.display = "block";
+                setPdfView(activeTab, "CHANGES");
             }}
             function showQualFromChanges(btn) {{
                 const activeTab = btn.closest('.tabcontent');
@@ -693,25 +1194,12 @@ def main():
                 btn.style.display = "none";
                 activeTab.querySelector('.changes-btn').style.display = "block";
                 activeTab.querySelector('.main-qual-toggle').innerText = "Main Draw";
+                setPdfView(activeTab, "QUALIFYING");
             }}
-            function exportToPDF() {{
-                const element = document.querySelector('.main-content');
-                document.body.classList.add('is-exporting');
-                
-                const title = document.querySelector('.main-title').innerText;
-                const subTitle = document.querySelector('.sub-title').innerText;
-                
-                const opt = {{
-                    margin:       0,
-                    filename:     'entry-list.pdf',
-                    image:        {{ type: 'jpeg', quality: 0.98 }},
-                    html2canvas:  {{ scale: 1.5, useCORS: true, backgroundColor: '#000000' }}, 
-                    jsPDF:        {{ unit: 'mm', format: [418, 244], orientation: 'landscape' }}
-                }};
-
-                html2pdf().set(opt).from(element).save().then(() => {{
-                    document.body.classList.remove('is-exporting');
-                }});
+            function setPdfView(activeTab, view) {{
+                // PDFs are pre-rendered per tournament and view; just point the link at the right file.
+                const link = activeTab.querySelector('.pdf-btn');
+                if (link && link.dataset.pdfBase) link.href = link.dataset.pdfBase + view + ".pdf";
             }}
         </script>
     </body>
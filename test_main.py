@@ -0,0 +1,38 @@
+import main
+
+
+def test_empty_scrape_does_not_report_removals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    players = ["Ana Perez", "Bia Silva", "Cara Lopez"]
+    countries = {"Ana Perez": "ARG", "Bia Silva": "BRA", "Cara Lopez": "USA"}
+
+    assert main.track_changes("X", "Qualifying", players, "Test Open", countries=countries) == [
+        {"date": main.datetime.now().strftime("%Y-%m-%d"), "tid": "X", "tournament": "Test Open",
+         "full_name": "Test Open", "level": None, "draw": "Qualifying", "action": "available",
+         "player": None, "country": None}
+    ]
+    for current in [[], players, [], players]:
+        assert main.track_changes("X", "Qualifying", current, "Test Open", countries=countries) == []
+
+    assert main.load_json(main.STATE_FILE)["X_QUALIFYING"] == players
+    assert main.load_json(main.LOG_FILE) == {}
+
+    events = main.track_changes("X", "Qualifying", players[:2], "Test Open", countries=countries)
+    assert [(e["action"], e["player"], e["country"]) for e in events] == [("removed", "CARA LOPEZ", "USA")]
+
+
+def test_file_sink_writes_one_file_per_digest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event = {"date": "2026-01-05", "tid": "X", "tournament": "WTA 125 Test", "full_name": "Test Open",
+             "level": "WTA 125", "draw": "Main Draw", "action": "available", "player": None, "country": None}
+    main.save_json(main.SUBSCRIBERS_FILE, [{"name": "all", "sink": "file"}])
+
+    main.dispatch_notifications([event])
+    monkeypatch.setattr(main, "datetime", type("FixedDatetime", (main.datetime,), {"now": classmethod(lambda cls: main.datetime(2030, 1, 1))}))
+    main.dispatch_notifications([dict(event, draw="Qualifying")])
+
+    digests = sorted((tmp_path / main.DIGEST_DIR).iterdir())
+    assert len(digests) == 2
+    assert "Main Draw list is now available." in digests[0].read_text(encoding="utf-8")
+    assert "Qualifying list is now available." in digests[1].read_text(encoding="utf-8")
+    assert main.load_json(main.NOTIFICATION_QUEUE_FILE)["all"]["pending"] == []